@@ -0,0 +1,21 @@
+"""Run the daily attendance check once, outside the web process.
+
+Invoke from system cron or a Kubernetes CronJob at 21:00 Asia/Kolkata and set
+RUN_SCHEDULER=false for the API workers:
+
+    0 21 * * * cd /app/backend && python cron.py
+"""
+import asyncio
+
+from server import client, daily_attendance_check
+
+
+async def main():
+    try:
+        await daily_attendance_check()
+    finally:
+        await client.close()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,80 @@
+"""One-off migration: remove duplicates that block the unique indexes.
+
+register and punch-in used to look for an existing document and then insert,
+so two concurrent requests could store two users with one email, or two
+attendance records for one user and day. startup_event now creates unique
+indexes on users.email and attendance (user_id, date), and index creation
+fails while such duplicates exist, so run this once against each existing
+database before deploying:
+
+    cd backend && python dedupe_unique_keys.py
+
+For a duplicated email the oldest account is kept and the other accounts'
+attendance is moved onto it. For a duplicated day the record that got furthest
+(punched out first, then earliest punch-in) is kept. Users are merged before
+attendance is deduplicated, since merging can itself create duplicate days.
+Safe to re-run.
+"""
+import asyncio
+import logging
+
+from server import client, db
+
+BATCH_SIZE = 1000
+
+
+async def duplicate_groups(collection, keys, sort, fields):
+    # Each group lists the duplicates in `sort` order, so the first one is the keeper
+    pipeline = [
+        {"$sort": sort},
+        {"$group": {
+            "_id": {key: f"${key}" for key in keys},
+            "docs": {"$push": {field: f"${field}" for field in ("_id", *fields)}},
+            "count": {"$sum": 1}
+        }},
+        {"$match": {"count": {"$gt": 1}}}
+    ]
+    cursor = await collection.aggregate(pipeline, allowDiskUse=True)
+    async for group in cursor:
+        yield group["docs"]
+
+
+async def merge_duplicate_users():
+    merged = 0
+    async for kept, *dropped in duplicate_groups(db.users, ["email"], {"created_at": 1}, ["user_id", "name"]):
+        await db.attendance.update_many(
+            {"user_id": {"$in": [user["user_id"] for user in dropped]}},
+            {"$set": {"user_id": kept["user_id"], "user_name": kept["name"]}}
+        )
+        await db.users.delete_many({"_id": {"$in": [user["_id"] for user in dropped]}})
+        merged += len(dropped)
+    return merged
+
+
+async def remove_duplicate_days():
+    removed = 0
+    ids = []
+    async for _, *dropped in duplicate_groups(db.attendance, ["user_id", "date"], {"punch_out": -1, "punch_in": 1}, []):
+        ids.extend(record["_id"] for record in dropped)
+        if len(ids) >= BATCH_SIZE:
+            removed += (await db.attendance.delete_many({"_id": {"$in": ids}})).deleted_count
+            ids = []
+
+    if ids:
+        removed += (await db.attendance.delete_many({"_id": {"$in": ids}})).deleted_count
+
+    return removed
+
+
+async def main():
+    try:
+        merged = await merge_duplicate_users()
+        logging.info(f"Merged {merged} duplicate users")
+        removed = await remove_duplicate_days()
+        logging.info(f"Removed {removed} duplicate attendance records")
+    finally:
+        await client.close()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
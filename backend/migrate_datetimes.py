@@ -0,0 +1,61 @@
+"""One-off migration: convert ISO-string timestamps to BSON dates.
+
+Older records stored punch/break times and created_at as isoformat() strings.
+server.py now writes and expects native datetimes, so run this once against
+each existing database before deploying:
+
+    cd backend && python migrate_datetimes.py
+
+Already-converted documents are skipped, so it is safe to re-run.
+"""
+import asyncio
+import logging
+from datetime import datetime
+
+from pymongo import UpdateOne
+
+from server import client, db
+
+DATETIME_FIELDS = {
+    "attendance": ["punch_in", "punch_out", "break_start", "break_end"],
+    "users": ["created_at"],
+}
+BATCH_SIZE = 1000
+
+
+async def migrate_collection(collection, fields):
+    query = {"$or": [{field: {"$type": "string"}} for field in fields]}
+    projection = {field: 1 for field in fields}
+    
+    migrated = 0
+    ops = []
+    async for doc in collection.find(query, projection):
+        updates = {
+            field: datetime.fromisoformat(doc[field])
+            for field in fields
+            if isinstance(doc.get(field), str)
+        }
+        ops.append(UpdateOne({"_id": doc["_id"]}, {"$set": updates}))
+        if len(ops) >= BATCH_SIZE:
+            await collection.bulk_write(ops, ordered=False)
+            migrated += len(ops)
+            ops = []
+    
+    if ops:
+        await collection.bulk_write(ops, ordered=False)
+        migrated += len(ops)
+    
+    return migrated
+
+
+async def main():
+    try:
+        for name, fields in DATETIME_FIELDS.items():
+            migrated = await migrate_collection(db[name], fields)
+            logging.info(f"Converted {migrated} {name} documents")
+    finally:
+        await client.close()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -7,15 +7,19 @@ load_dotenv(dotenv_path=Path(__file__).parent / ".env")
 
 from fastapi import FastAPI, APIRouter, HTTPException, Depends, status
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
+from fastapi.responses import Response, StreamingResponse
 from dotenv import load_dotenv
 from starlette.middleware.cors import CORSMiddleware
-from motor.motor_asyncio import AsyncIOMotorClient
+from pymongo import AsyncMongoClient, ReturnDocument, UpdateOne
+from pymongo.errors import DuplicateKeyError
 import os
 import logging
 from pathlib import Path
 from pydantic import BaseModel, EmailStr, Field, ConfigDict
 from typing import List, Optional
-from datetime import datetime, timezone, timedelta
+from datetime import date, datetime, timezone, timedelta
+from calendar import monthrange
+import uuid
 from passlib.context import CryptContext
 from jose import JWTError, jwt
 import asyncio
@@ -24,13 +28,28 @@ from apscheduler.schedulers.asyncio import AsyncIOScheduler
 from apscheduler.triggers.cron import CronTrigger
 import pytz
 import hashlib
+import orjson
+from jinja2 import Template
+from cachetools import TTLCache
 
 ROOT_DIR = Path(__file__).parent
 load_dotenv(ROOT_DIR / '.env')
 
 # MongoDB connection
 mongo_url = os.environ['MONGO_URL']
-client = AsyncIOMotorClient(mongo_url)
+# Timestamps are stored as BSON dates; read them back as aware UTC datetimes.
+# Short timeouts make an unreachable database fail fast instead of hanging requests.
+client = AsyncMongoClient(
+    mongo_url,
+    tz_aware=True,
+    tzinfo=timezone.utc,
+    maxPoolSize=200,
+    minPoolSize=10,
+    serverSelectionTimeoutMS=3000,
+    connectTimeoutMS=3000,
+    socketTimeoutMS=10000,
+    retryWrites=True
+)
 db = client[os.environ['DB_NAME']]
 
 # Security
@@ -38,14 +57,26 @@ pwd_context = CryptContext(
     schemes=["argon2"],
     deprecated="auto"
 )
+# Checked against when the email is unknown, so failed logins take the same time either way
+DUMMY_PASSWORD_HASH = pwd_context.hash(uuid.uuid4().hex)
 security = HTTPBearer()
 SECRET_KEY = os.environ.get('SECRET_KEY', 'your-secret-key-change-in-production')
 ALGORITHM = "HS256"
 ACCESS_TOKEN_EXPIRE_DAYS = 30
 
+# Authenticated users keyed by a digest of their bearer token, so repeat requests skip JWT decode and the user lookup
+_user_cache = TTLCache(maxsize=10_000, ttl=30)
+
 # Resend Email
 resend.api_key = os.environ.get('RESEND_API_KEY', '')
 SENDER_EMAIL = os.environ.get('SENDER_EMAIL', 'onboarding@resend.dev')
+RESEND_BATCH_LIMIT = 100  # max emails per Resend batch request
+
+# Business timezone: attendance days, weekends and the 9 PM alert all follow IST
+ist = pytz.timezone('Asia/Kolkata')
+
+# Set to "false" when the daily check runs from cron.py instead of the web workers
+RUN_SCHEDULER = os.environ.get('RUN_SCHEDULER', 'true').lower() == 'true'
 
 # Create the main app
 app = FastAPI()
@@ -68,7 +99,7 @@ class User(BaseModel):
     email: str
     name: str
     role: str
-    created_at: str
+    created_at: datetime
 
 class AttendancePunchIn(BaseModel):
     pass
@@ -83,27 +114,29 @@ class AttendanceRecord(BaseModel):
     user_name: str
     user_email: str
     date: str
-    punch_in: Optional[str] = None
-    punch_out: Optional[str] = None
-    break_start: Optional[str] = None
-    break_end: Optional[str] = None
+    punch_in: Optional[datetime] = None
+    punch_out: Optional[datetime] = None
+    break_start: Optional[datetime] = None
+    break_end: Optional[datetime] = None
     total_hours: Optional[float] = None
     break_duration: Optional[float] = None
     is_complete: bool = False
     is_weekend: bool = False
     status: str = 'active'  # active, incomplete, complete, break_exceeded
+    notified: bool = False  # included in a daily incomplete-shift alert
 
 class MonthlyReportQuery(BaseModel):
     year: int
     month: int
 
 # Helper Functions
-def hash_password(password: str) -> str:
-    return pwd_context.hash(password)
+# Password hashing is deliberately slow CPU work, so keep it off the event loop
+async def hash_password(password: str) -> str:
+    return await asyncio.to_thread(pwd_context.hash, password)
 
 
-def verify_password(plain_password: str, hashed_password: str) -> bool:
-    return pwd_context.verify(plain_password, hashed_password)
+async def verify_password(plain_password: str, hashed_password: str) -> bool:
+    return await asyncio.to_thread(pwd_context.verify, plain_password, hashed_password)
 
 
 
@@ -116,32 +149,57 @@ def create_access_token(data: dict):
     return encoded_jwt
 
 async def get_current_user(credentials: HTTPAuthorizationCredentials = Depends(security)):
+    token = credentials.credentials
+    cache_key = hashlib.blake2b(token.encode(), digest_size=16).digest()
+    cached_user = _user_cache.get(cache_key)
+    if cached_user is not None:
+        return cached_user
+    
     try:
-        token = credentials.credentials
         payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
         user_id: str = payload.get("sub")
         if user_id is None:
             raise HTTPException(status_code=401, detail="Invalid authentication credentials")
-        user = await db.users.find_one({"user_id": user_id}, {"_id": 0})
+        user = await db.users.find_one({"user_id": user_id}, {"_id": 0, "password": 0})
         if user is None:
             raise HTTPException(status_code=401, detail="User not found")
-        return User(**user)
+        current_user = User(**user)
+        _user_cache[cache_key] = current_user
+        return current_user
     except JWTError:
         raise HTTPException(status_code=401, detail="Invalid authentication credentials")
 
-def is_weekend(date_obj: datetime) -> bool:
-    return date_obj.weekday() in [5, 6]  # Saturday=5, Sunday=6
-
-def calculate_hours(start: datetime, end: datetime) -> float:
-    delta = end - start
-    return round(delta.total_seconds() / 3600, 2)
-
-async def send_incomplete_shift_email(employer_email: str, incomplete_employees: List[dict]):
-    if not resend.api_key:
-        logging.warning("Resend API key not configured. Email not sent.")
-        return
-    
-    html_content = f"""
+def business_date(moment: datetime) -> date:
+    return moment.astimezone(ist).date()
+
+def is_weekend(day: date) -> bool:
+    return day.weekday() in [5, 6]  # Saturday=5, Sunday=6
+
+def hours_between(start, end) -> dict:
+    # Aggregation expression for the hours between two BSON dates, rounded to 2 places
+    return {"$round": [{"$divide": [{"$subtract": [end, start]}, 3600 * 1000]}, 2]}
+
+async def stream_json_array(cursor, prefetched: List[dict], chunk_size: int = 500):
+    # Serialize documents as they arrive from the cursor instead of materializing the whole result;
+    # prefetched holds any documents the caller already read from the cursor
+    buffer = []
+    separator = b"["
+    for doc in prefetched:
+        buffer.append(separator)
+        buffer.append(orjson.dumps(doc))
+        separator = b","
+    async for doc in cursor:
+        buffer.append(separator)
+        buffer.append(orjson.dumps(doc))
+        separator = b","
+        if len(buffer) >= 2 * chunk_size:
+            yield b"".join(buffer)
+            buffer.clear()
+    buffer.append(b"]" if separator == b"," else b"[]")
+    yield b"".join(buffer)
+
+# Compiled once at import; autoescape keeps employee names and emails from injecting markup
+INCOMPLETE_SHIFT_TEMPLATE = Template("""
     <html>
     <body style="font-family: Arial, sans-serif; padding: 20px;">
         <h2 style="color: #2563eb;">Daily Attendance Alert</h2>
@@ -155,86 +213,121 @@ async def send_incomplete_shift_email(employer_email: str, incomplete_employees:
                 </tr>
             </thead>
             <tbody>
-    """
-    
-    for emp in incomplete_employees:
-        html_content += f"""
+            {% for emp in employees %}
                 <tr>
-                    <td style="border: 1px solid #e5e7eb; padding: 12px;">{emp['name']}</td>
-                    <td style="border: 1px solid #e5e7eb; padding: 12px;">{emp['email']}</td>
-                    <td style="border: 1px solid #e5e7eb; padding: 12px;">{emp['hours']} hours</td>
+                    <td style="border: 1px solid #e5e7eb; padding: 12px;">{{ emp.name }}</td>
+                    <td style="border: 1px solid #e5e7eb; padding: 12px;">{{ emp.email }}</td>
+                    <td style="border: 1px solid #e5e7eb; padding: 12px;">{{ emp.hours }} hours</td>
                 </tr>
-        """
-    
-    html_content += """
+            {% endfor %}
             </tbody>
         </table>
         <p style="margin-top: 20px; color: #6b7280;">This is an automated alert sent at 9 PM IST.</p>
     </body>
     </html>
-    """
-    
-    try:
-        params = {
-            "from": SENDER_EMAIL,
-            "to": [employer_email],
-            "subject": f"Daily Attendance Alert - {len(incomplete_employees)} Incomplete Shifts",
-            "html": html_content
-        }
-        email = await asyncio.to_thread(resend.Emails.send, params)
-        logging.info(f"Email sent to {employer_email}: {email.get('id')}")
-    except Exception as e:
-        logging.error(f"Failed to send email: {str(e)}")
+    """, autoescape=True)
+
+def build_incomplete_shift_html(incomplete_employees: List[dict]) -> str:
+    return INCOMPLETE_SHIFT_TEMPLATE.render(employees=incomplete_employees)
+
+# Returns the employer addresses the alert could not be sent to
+async def send_incomplete_shift_emails(employer_emails: List[str], incomplete_employees: List[dict]) -> List[str]:
+    if not resend.api_key:
+        logging.warning("Resend API key not configured. Email not sent.")
+        return employer_emails
+    
+    # Every employer gets the same alert, so render it once and use Resend's batch endpoint
+    html_content = build_incomplete_shift_html(incomplete_employees)
+    subject = f"Daily Attendance Alert - {len(incomplete_employees)} Incomplete Shifts"
+    params = [
+        {"from": SENDER_EMAIL, "to": [email], "subject": subject, "html": html_content}
+        for email in employer_emails
+    ]
+    
+    undelivered = []
+    for i in range(0, len(params), RESEND_BATCH_LIMIT):
+        batch = params[i:i + RESEND_BATCH_LIMIT]
+        try:
+            await asyncio.to_thread(resend.Batch.send, batch)
+            logging.info(f"Alert email sent to {len(batch)} employers")
+        except Exception as e:
+            logging.error(f"Failed to send email batch: {str(e)}")
+            undelivered.extend(employer_emails[i:i + RESEND_BATCH_LIMIT])
+    
+    return undelivered
 
 async def daily_attendance_check():
     logging.info("Running daily attendance check...")
     
-    today = datetime.now(timezone.utc).date().isoformat()
+    today = business_date(datetime.now(timezone.utc)).isoformat()
     
-    # Get all attendance records for today
-    attendance_records = await db.attendance.find(
-        {"date": today, "is_weekend": False},
-        {"_id": 0}
-    ).to_list(1000)
+    # Every web worker runs its own scheduler; only the first to claim today's lock sends the alert
+    lock_id = f"daily_attendance_check:{today}"
+    try:
+        await db.scheduler_locks.insert_one({
+            "_id": lock_id,
+            "created_at": datetime.now(timezone.utc)
+        })
+    except DuplicateKeyError:
+        logging.info("Daily attendance check already ran today, skipping")
+        return
     
-    incomplete_employees = []
-    
-    for record in attendance_records:
-        if record.get('punch_in') and record.get('punch_out'):
-            total_hours = record.get('total_hours', 0)
-            if total_hours < 9:
-                incomplete_employees.append({
-                    'name': record['user_name'],
-                    'email': record['user_email'],
-                    'hours': total_hours
-                })
-        elif record.get('punch_in') and not record.get('punch_out'):
-            # Not punched out yet
-            incomplete_employees.append({
-                'name': record['user_name'],
-                'email': record['user_email'],
-                'hours': 0
-            })
-    
-    if incomplete_employees:
+    try:
+        # Let MongoDB pick out the incomplete shifts: still punched in, or punched out short of 9 hours
+        pipeline = [
+            {"$match": {
+                "date": today,
+                "is_weekend": False,
+                "punch_in": {"$ne": None},
+                "$or": [{"punch_out": None}, {"total_hours": {"$lt": 9}}]
+            }},
+            {"$project": {
+                "name": "$user_name",
+                "email": "$user_email",
+                "hours": {"$cond": [{"$ifNull": ["$punch_out", False]}, "$total_hours", 0]}
+            }}
+        ]
+        cursor = await db.attendance.aggregate(pipeline)
+        incomplete_employees = await cursor.to_list(None)
+        
+        if not incomplete_employees:
+            return
+        
         # Get all employers
-        employers = await db.users.find({"role": "employer"}, {"_id": 0}).to_list(1000)
+        employers = await db.users.find({"role": "employer"}, {"_id": 0, "email": 1}).to_list(1000)
         
-        for employer in employers:
-            await send_incomplete_shift_email(employer['email'], incomplete_employees)
+        undelivered = await send_incomplete_shift_emails([employer['email'] for employer in employers], incomplete_employees)
+    except Exception:
+        # Free today's lock so another worker or a cron rerun can still send the alert
+        await db.scheduler_locks.delete_one({"_id": lock_id})
+        raise
+    
+    # The run only counts once every employer has the alert; a rerun resends to all of them
+    if undelivered:
+        logging.error(f"Daily alert not delivered to {len(undelivered)} employers, releasing today's lock")
+        await db.scheduler_locks.delete_one({"_id": lock_id})
+        return
+    
+    # Outside the try: the alert already went out, so a failure here must not free the lock for a resend
+    ops = [UpdateOne({"_id": emp['_id']}, {"$set": {"notified": True}}) for emp in incomplete_employees]
+    await db.attendance.bulk_write(ops, ordered=False)
+
+# Liveness probe; touches no database so it stays cheap for load balancers and client warm-up
+@api_router.get("/health")
+async def health():
+    return {"status": "ok"}
 
 # Auth Routes
 @api_router.post("/auth/register")
 async def register(user_data: UserRegister):
     # Check if user exists
-    existing_user = await db.users.find_one({"email": user_data.email})
+    existing_user = await db.users.find_one({"email": user_data.email}, {"_id": 1})
     if existing_user:
         raise HTTPException(status_code=400, detail="Email already registered")
     
     # Create user
-    import uuid
     user_id = str(uuid.uuid4())
-    hashed_password = hash_password(user_data.password)
+    hashed_password = await hash_password(user_data.password)
     
     user_doc = {
         "user_id": user_id,
@@ -242,10 +335,13 @@ async def register(user_data: UserRegister):
         "password": hashed_password,
         "name": user_data.name,
         "role": user_data.role,
-        "created_at": datetime.now(timezone.utc).isoformat()
+        "created_at": datetime.now(timezone.utc)
     }
     
-    await db.users.insert_one(user_doc)
+    try:
+        await db.users.insert_one(user_doc)
+    except DuplicateKeyError:
+        raise HTTPException(status_code=400, detail="Email already registered")
     
     token = create_access_token({"sub": user_id, "role": user_data.role})
     
@@ -261,8 +357,13 @@ async def register(user_data: UserRegister):
 
 @api_router.post("/auth/login")
 async def login(credentials: UserLogin):
-    user = await db.users.find_one({"email": credentials.email})
-    if not user or not verify_password(credentials.password, user['password']):
+    user = await db.users.find_one(
+        {"email": credentials.email},
+        {"_id": 0, "user_id": 1, "email": 1, "name": 1, "role": 1, "password": 1}
+    )
+    hashed_password = user['password'] if user else DUMMY_PASSWORD_HASH
+    password_ok = await verify_password(credentials.password, hashed_password)
+    if not user or not password_ok:
         raise HTTPException(status_code=401, detail="Invalid email or password")
     
     token = create_access_token({"sub": user['user_id'], "role": user['role']})
@@ -283,18 +384,11 @@ async def punch_in(current_user: User = Depends(get_current_user)):
     if current_user.role != 'employee':
         raise HTTPException(status_code=403, detail="Only employees can punch in")
     
-    today = datetime.now(timezone.utc).date()
-    today_str = today.isoformat()
-    
-    # Check if already punched in today
-    existing = await db.attendance.find_one({"user_id": current_user.user_id, "date": today_str})
-    if existing and existing.get('punch_in'):
-        raise HTTPException(status_code=400, detail="Already punched in today")
-    
     now = datetime.now(timezone.utc)
-    is_weekend_day = is_weekend(now)
+    today = business_date(now)
+    today_str = today.isoformat()
+    is_weekend_day = is_weekend(today)
     
-    import uuid
     attendance_id = str(uuid.uuid4())
     
     attendance_doc = {
@@ -303,7 +397,7 @@ async def punch_in(current_user: User = Depends(get_current_user)):
         "user_name": current_user.name,
         "user_email": current_user.email,
         "date": today_str,
-        "punch_in": now.isoformat(),
+        "punch_in": now,
         "punch_out": None,
         "break_start": None,
         "break_end": None,
@@ -311,10 +405,15 @@ async def punch_in(current_user: User = Depends(get_current_user)):
         "break_duration": None,
         "is_complete": False,
         "is_weekend": is_weekend_day,
-        "status": "active"
+        "status": "active",
+        "notified": False
     }
     
-    await db.attendance.insert_one(attendance_doc)
+    # The unique (user_id, date) index rejects a second punch-in for the day
+    try:
+        await db.attendance.insert_one(attendance_doc)
+    except DuplicateKeyError:
+        raise HTTPException(status_code=400, detail="Already punched in today")
     
     return {"message": "Punched in successfully", "punch_in_time": now.isoformat()}
 
@@ -323,46 +422,49 @@ async def punch_out(current_user: User = Depends(get_current_user)):
     if current_user.role != 'employee':
         raise HTTPException(status_code=403, detail="Only employees can punch out")
     
-    today = datetime.now(timezone.utc).date().isoformat()
-    
-    attendance = await db.attendance.find_one({"user_id": current_user.user_id, "date": today})
-    if not attendance or not attendance.get('punch_in'):
-        raise HTTPException(status_code=400, detail="No active punch-in found for today")
-    
-    if attendance.get('punch_out'):
-        raise HTTPException(status_code=400, detail="Already punched out today")
-    
     now = datetime.now(timezone.utc)
-    punch_in_time = datetime.fromisoformat(attendance['punch_in'].replace('Z', '+00:00'))
-    
-    # Calculate total hours
-    total_hours = calculate_hours(punch_in_time, now)
-    
-    # Calculate break duration if break was taken
-    break_duration = 0
-    if attendance.get('break_start') and attendance.get('break_end'):
-        break_start_time = datetime.fromisoformat(attendance['break_start'].replace('Z', '+00:00'))
-        break_end_time = datetime.fromisoformat(attendance['break_end'].replace('Z', '+00:00'))
-        break_duration = calculate_hours(break_start_time, break_end_time)
+    today = business_date(now).isoformat()
+    
+    # Close the shift and derive hours and status in one pipeline update, entirely server-side
+    attendance = await db.attendance.find_one_and_update(
+        {"user_id": current_user.user_id, "date": today, "punch_in": {"$ne": None}, "punch_out": None},
+        [
+            {"$set": {
+                "punch_out": now,
+                "total_hours": hours_between("$punch_in", now),
+                "break_duration": {"$cond": [
+                    {"$and": [{"$ifNull": ["$break_start", False]}, {"$ifNull": ["$break_end", False]}]},
+                    hours_between("$break_start", "$break_end"),
+                    0
+                ]}
+            }},
+            {"$set": {
+                "is_complete": {"$gte": [{"$subtract": ["$total_hours", "$break_duration"]}, 9]}
+            }},
+            {"$set": {
+                "status": {"$cond": [
+                    {"$gt": ["$break_duration", 1]},
+                    "break_exceeded",
+                    {"$cond": ["$is_complete", "complete", "incomplete"]}
+                ]}
+            }}
+        ],
+        projection={"_id": 0, "total_hours": 1, "break_duration": 1, "is_complete": 1},
+        return_document=ReturnDocument.AFTER
+    )
+    if attendance is None:
+        existing = await db.attendance.find_one(
+            {"user_id": current_user.user_id, "date": today},
+            {"_id": 0, "punch_in": 1, "punch_out": 1}
+        )
+        if not existing or not existing.get('punch_in'):
+            raise HTTPException(status_code=400, detail="No active punch-in found for today")
+        raise HTTPException(status_code=400, detail="Already punched out today")
     
-    # Determine status
+    total_hours = attendance['total_hours']
+    break_duration = attendance['break_duration']
     work_hours = total_hours - break_duration
-    is_complete = work_hours >= 9
-    status = 'complete' if is_complete else 'incomplete'
-    
-    if break_duration > 1:
-        status = 'break_exceeded'
-    
-    await db.attendance.update_one(
-        {"user_id": current_user.user_id, "date": today},
-        {"$set": {
-            "punch_out": now.isoformat(),
-            "total_hours": total_hours,
-            "break_duration": break_duration,
-            "is_complete": is_complete,
-            "status": status
-        }}
-    )
+    is_complete = attendance['is_complete']
     
     return {
         "message": "Punched out successfully",
@@ -377,24 +479,30 @@ async def start_break(current_user: User = Depends(get_current_user)):
     if current_user.role != 'employee':
         raise HTTPException(status_code=403, detail="Only employees can start break")
     
-    today = datetime.now(timezone.utc).date().isoformat()
-    
-    attendance = await db.attendance.find_one({"user_id": current_user.user_id, "date": today})
-    if not attendance or not attendance.get('punch_in'):
-        raise HTTPException(status_code=400, detail="Must punch in first")
-    
-    if attendance.get('punch_out'):
-        raise HTTPException(status_code=400, detail="Already punched out")
-    
-    if attendance.get('break_start') and not attendance.get('break_end'):
-        raise HTTPException(status_code=400, detail="Break already in progress")
-    
     now = datetime.now(timezone.utc)
-    
-    await db.attendance.update_one(
-        {"user_id": current_user.user_id, "date": today},
-        {"$set": {"break_start": now.isoformat()}}
+    today = business_date(now).isoformat()
+    
+    attendance = await db.attendance.find_one_and_update(
+        {
+            "user_id": current_user.user_id,
+            "date": today,
+            "punch_in": {"$ne": None},
+            "punch_out": None,
+            "$or": [{"break_start": None}, {"break_end": {"$ne": None}}]
+        },
+        {"$set": {"break_start": now}},
+        projection={"_id": 1}
     )
+    if attendance is None:
+        existing = await db.attendance.find_one(
+            {"user_id": current_user.user_id, "date": today},
+            {"_id": 0, "punch_in": 1, "punch_out": 1}
+        )
+        if not existing or not existing.get('punch_in'):
+            raise HTTPException(status_code=400, detail="Must punch in first")
+        if existing.get('punch_out'):
+            raise HTTPException(status_code=400, detail="Already punched out")
+        raise HTTPException(status_code=400, detail="Break already in progress")
     
     return {"message": "Break started", "break_start_time": now.isoformat()}
 
@@ -403,25 +511,26 @@ async def end_break(current_user: User = Depends(get_current_user)):
     if current_user.role != 'employee':
         raise HTTPException(status_code=403, detail="Only employees can end break")
     
-    today = datetime.now(timezone.utc).date().isoformat()
-    
-    attendance = await db.attendance.find_one({"user_id": current_user.user_id, "date": today})
-    if not attendance or not attendance.get('break_start'):
-        raise HTTPException(status_code=400, detail="No active break found")
-    
-    if attendance.get('break_end'):
-        raise HTTPException(status_code=400, detail="Break already ended")
-    
     now = datetime.now(timezone.utc)
+    today = business_date(now).isoformat()
     
-    await db.attendance.update_one(
-        {"user_id": current_user.user_id, "date": today},
-        {"$set": {"break_end": now.isoformat()}}
+    attendance = await db.attendance.find_one_and_update(
+        {"user_id": current_user.user_id, "date": today, "break_start": {"$ne": None}, "break_end": None},
+        {"$set": {"break_end": now}},
+        projection={"_id": 1}
     )
+    if attendance is None:
+        existing = await db.attendance.find_one(
+            {"user_id": current_user.user_id, "date": today},
+            {"_id": 0, "break_start": 1}
+        )
+        if not existing or not existing.get('break_start'):
+            raise HTTPException(status_code=400, detail="No active break found")
+        raise HTTPException(status_code=400, detail="Break already ended")
     
     return {"message": "Break ended", "break_end_time": now.isoformat()}
 
-@api_router.get("/attendance/my-history", response_model=List[AttendanceRecord])
+@api_router.get("/attendance/my-history", responses={200: {"model": List[AttendanceRecord]}})
 async def get_my_history(current_user: User = Depends(get_current_user)):
     if current_user.role != 'employee':
         raise HTTPException(status_code=403, detail="Only employees can view their history")
@@ -431,14 +540,15 @@ async def get_my_history(current_user: User = Depends(get_current_user)):
         {"_id": 0}
     ).sort("date", -1).limit(90).to_list(90)
     
-    return records
+    # Records come straight from our own collection; serialize them without re-validating each one
+    return Response(orjson.dumps(records), media_type="application/json")
 
 @api_router.get("/attendance/today-status")
 async def get_today_status(current_user: User = Depends(get_current_user)):
     if current_user.role != 'employee':
         raise HTTPException(status_code=403, detail="Only employees can view their status")
     
-    today = datetime.now(timezone.utc).date().isoformat()
+    today = business_date(datetime.now(timezone.utc)).isoformat()
     
     attendance = await db.attendance.find_one(
         {"user_id": current_user.user_id, "date": today},
@@ -450,38 +560,43 @@ async def get_today_status(current_user: User = Depends(get_current_user)):
     
     return {"has_attendance": True, "attendance": attendance}
 
-@api_router.get("/attendance/all-employees", response_model=List[AttendanceRecord])
+@api_router.get("/attendance/all-employees", responses={200: {"model": List[AttendanceRecord]}})
 async def get_all_employees_attendance(current_user: User = Depends(get_current_user)):
     if current_user.role != 'employer':
         raise HTTPException(status_code=403, detail="Only employers can view all attendance")
     
-    today = datetime.now(timezone.utc).date().isoformat()
+    today = business_date(datetime.now(timezone.utc)).isoformat()
     
     records = await db.attendance.find(
         {"date": today},
         {"_id": 0}
     ).to_list(1000)
     
-    return records
+    return Response(orjson.dumps(records), media_type="application/json")
 
-@api_router.post("/attendance/monthly-report", response_model=List[AttendanceRecord])
+@api_router.post("/attendance/monthly-report", responses={200: {"model": List[AttendanceRecord]}})
 async def get_monthly_report(query: MonthlyReportQuery, current_user: User = Depends(get_current_user)):
     if current_user.role != 'employer':
         raise HTTPException(status_code=403, detail="Only employers can view monthly reports")
     
     # Create date range for the month
-    from calendar import monthrange
     _, last_day = monthrange(query.year, query.month)
     
     start_date = f"{query.year}-{query.month:02d}-01"
     end_date = f"{query.year}-{query.month:02d}-{last_day:02d}"
     
-    records = await db.attendance.find(
+    cursor = db.attendance.find(
         {"date": {"$gte": start_date, "$lte": end_date}},
         {"_id": 0}
-    ).sort("date", -1).to_list(10000)
+    ).sort("date", -1).batch_size(500)
     
-    return records
+    # Run the query and read its first batch before the 200 goes out, so a failing query is still a 500
+    try:
+        prefetched = [await cursor.next()]
+    except StopAsyncIteration:
+        prefetched = []
+    
+    return StreamingResponse(stream_json_array(cursor, prefetched), media_type="application/json")
 
 # Include router
 app.include_router(api_router)
@@ -504,7 +619,6 @@ logger = logging.getLogger(__name__)
 
 # Scheduler for daily email at 9 PM IST
 scheduler = AsyncIOScheduler()
-ist = pytz.timezone('Asia/Kolkata')
 scheduler.add_job(
     daily_attendance_check,
     CronTrigger(hour=21, minute=0, timezone=ist),
@@ -513,10 +627,26 @@ scheduler.add_job(
 
 @app.on_event("startup")
 async def startup_event():
-    scheduler.start()
-    logger.info("Scheduler started - Daily email at 9 PM IST")
+    # Surface a bad MONGO_URL at boot rather than on the first request
+    await client.admin.command("ping")
+    
+    try:
+        await db.users.create_index("email", unique=True)
+        await db.users.create_index("user_id", unique=True)
+        await db.attendance.create_index([("user_id", 1), ("date", -1)], unique=True)
+    except DuplicateKeyError:
+        logger.error("Existing duplicate users or attendance days block the unique indexes; run backend/dedupe_unique_keys.py")
+        raise
+    await db.attendance.create_index([("date", 1), ("is_weekend", 1)])
+    await db.scheduler_locks.create_index("created_at", expireAfterSeconds=7 * 24 * 3600)
+    logger.info("Database indexes ensured")
+    
+    if RUN_SCHEDULER:
+        scheduler.start()
+        logger.info("Scheduler started - Daily email at 9 PM IST")
 
 @app.on_event("shutdown")
 async def shutdown_db_client():
-    scheduler.shutdown()
-    client.close()
+    if scheduler.running:
+        scheduler.shutdown()
+    await client.close()
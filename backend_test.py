@@ -1,8 +1,75 @@
-import requests
+import asyncio
+import base64
+import fcntl
+import hashlib
+import httpx
+import os
 import sys
 import json
+import orjson
+import tempfile
 from datetime import datetime, timedelta
+from pathlib import Path
 import time
+import uuid
+
+TOKEN_CACHE_DIR = Path(tempfile.gettempdir())
+TEST_PASSWORD = "TestPass123!"
+HTTP_METHODS = frozenset(('GET', 'POST', 'PUT', 'DELETE'))
+REGISTRATION_KEYS = frozenset(('token', 'user'))
+
+# Cache files are keyed by server as well, so runs against different deployments don't share them
+def token_cache_path(base_url, email):
+    return TOKEN_CACHE_DIR / f".attendance-token-{hashlib.md5(f'{base_url} {email}'.encode()).hexdigest()}"
+
+def saved_accounts_path(base_url):
+    return TOKEN_CACHE_DIR / f".attendance-test-creds-{hashlib.md5(base_url.encode()).hexdigest()}.json"
+
+def write_private(path, text):
+    """Write a file only the current user can read (tokens and test accounts)"""
+    fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+    with os.fdopen(fd, 'w') as f:
+        f.write(text)
+
+def token_expiry(token):
+    """Read a JWT's exp claim without verifying it (only used to decide on reuse)"""
+    try:
+        payload = token.split('.')[1]
+        payload += '=' * (-len(payload) % 4)
+        return json.loads(base64.urlsafe_b64decode(payload)).get('exp', 0)
+    except (IndexError, ValueError):
+        return 0
+
+def current_month():
+    today = datetime.now()
+    return {"year": today.year, "month": today.month}
+
+# Single-request checks:
+# (test name, method, endpoint, body builder taking the tester, role whose token is sent,
+#  expected status, expected body: frozenset of required keys, list for a JSON array, or None for status only)
+LOGIN_CHECK = (
+    "Employee Login", 'POST', 'auth/login',
+    lambda t: {"email": t.employee_user['email'], "password": TEST_PASSWORD},
+    None, 200, frozenset(('token',))
+)
+# The attendance workflow: each step depends on the one before, so these run in order
+WORKFLOW_STEPS = [
+    ("Punch In", 'POST', 'attendance/punch-in', None, 'employee', 200, frozenset(('message', 'punch_in_time'))),
+    ("Today Status", 'GET', 'attendance/today-status', None, 'employee', 200, frozenset(('has_attendance',))),
+    ("Start Break", 'POST', 'attendance/start-break', None, 'employee', 200, frozenset(('message', 'break_start_time'))),
+    ("End Break", 'POST', 'attendance/end-break', None, 'employee', 200, frozenset(('message', 'break_end_time'))),
+    ("Punch Out", 'POST', 'attendance/punch-out', None, 'employee', 200, frozenset(('message', 'total_hours'))),
+]
+API_CHECKS = [
+    ("Duplicate Registration Prevention", 'POST', 'auth/register',
+     lambda t: {"email": t.employee_user['email'], "password": "AnotherPass123!", "name": "Duplicate User", "role": "employee"},
+     None, 400, None),
+    ("Attendance History", 'GET', 'attendance/my-history', None, 'employee', 200, list),
+    ("Monthly Report", 'POST', 'attendance/monthly-report', lambda t: current_month(), 'employer', 200, list),
+    # Employee should not be able to access monthly report
+    ("Role Permissions (Employee blocked from employer endpoint)", 'POST', 'attendance/monthly-report',
+     lambda t: {"year": 2025, "month": 1}, 'employee', 403, None),
+]
 
 class AttendanceAPITester:
     def __init__(self, base_url="https://workshift-27.preview.emergentagent.com"):
@@ -10,11 +77,72 @@ class AttendanceAPITester:
         self.api_url = f"{base_url}/api"
         self.employee_token = None
         self.employer_token = None
+        self._employee_headers = None
+        self._employer_headers = None
         self.employee_user = None
         self.employer_user = None
+        self._token_cache = {}
+        self.accounts_path = saved_accounts_path(base_url)
+        self._accounts_lock = None
         self.tests_run = 0
         self.tests_passed = 0
         self.failed_tests = []
+        self.client = None
+
+    async def __aenter__(self):
+        # One keep-alive HTTP/2 connection; concurrent tests share it as separate streams.
+        # The transport retries failed connection attempts so a flaky connect doesn't fail a test.
+        transport = httpx.AsyncHTTPTransport(
+            http2=True,
+            retries=2,
+            limits=httpx.Limits(max_keepalive_connections=8),
+        )
+        self.client = httpx.AsyncClient(
+            base_url=f"{self.api_url}/",
+            transport=transport,
+            headers={'Content-Type': 'application/json'},
+            timeout=10,
+        )
+        await self.warm_up()
+        return self
+
+    async def warm_up(self, attempts=3):
+        """Pay DNS + TCP + TLS setup up front so the first test isn't charged for it"""
+        for attempt in range(attempts):
+            try:
+                response = await self.client.get('health', timeout=5)
+                if response.status_code not in (502, 503, 504):
+                    return
+            except httpx.HTTPError:
+                pass
+            await asyncio.sleep(0.1 * 2 ** attempt)
+
+    async def __aexit__(self, *exc_info):
+        await self.client.aclose()
+        if self._accounts_lock is not None:
+            os.close(self._accounts_lock)
+
+    def cache_token(self, email, token):
+        """Remember a token for this run and persist it (mode 0600) for later runs"""
+        self._token_cache[email] = token
+        write_private(token_cache_path(self.base_url, email), token)
+
+    def cached_token(self, email):
+        """Return a cached token for email if it is still valid for at least a minute"""
+        token = self._token_cache.get(email)
+        if token is None:
+            try:
+                token = token_cache_path(self.base_url, email).read_text().strip()
+            except OSError:
+                return None
+        if token_expiry(token) <= time.time() + 60:
+            return None
+        self._token_cache[email] = token
+        return token
+
+    def auth_headers(self, token):
+        """Build the per-request headers for a JWT"""
+        return {'Authorization': f'Bearer {token}'}
 
     def log_test(self, name, success, details=""):
         """Log test results"""
@@ -26,272 +154,178 @@ class AttendanceAPITester:
             print(f"❌ {name} - FAILED: {details}")
             self.failed_tests.append({"test": name, "error": details})
 
-    def make_request(self, method, endpoint, data=None, token=None, expected_status=200):
-        """Make HTTP request with error handling"""
-        url = f"{self.api_url}/{endpoint}"
-        headers = {'Content-Type': 'application/json'}
-        
-        if token:
-            headers['Authorization'] = f'Bearer {token}'
+    async def make_request(self, method, endpoint, data=None, headers=None, expected_status=200, parse_json=True):
+        """Make HTTP request with error handling; parse_json=False skips decoding the body"""
+        if method not in HTTP_METHODS:
+            raise ValueError(f"Unsupported HTTP method: {method}")
 
         try:
-            if method == 'GET':
-                response = requests.get(url, headers=headers, timeout=10)
-            elif method == 'POST':
-                response = requests.post(url, json=data, headers=headers, timeout=10)
-            elif method == 'PUT':
-                response = requests.put(url, json=data, headers=headers, timeout=10)
-            elif method == 'DELETE':
-                response = requests.delete(url, headers=headers, timeout=10)
+            # Encode bodies with orjson; Content-Type: application/json is already a client default
+            content = orjson.dumps(data) if data is not None else None
+            response = await self.client.request(method, endpoint, content=content, headers=headers)
 
             success = response.status_code == expected_status
-            return success, response.status_code, response.json() if response.content else {}
+            if not parse_json:
+                return success, response.status_code, None
+            return success, response.status_code, orjson.loads(response.content) if response.content else {}
 
-        except requests.exceptions.RequestException as e:
+        except httpx.HTTPError as e:
             return False, 0, {"error": str(e)}
         except json.JSONDecodeError:
             return False, response.status_code, {"error": "Invalid JSON response"}
 
-    def test_user_registration(self):
-        """Test user registration for both employee and employer"""
-        timestamp = int(time.time())
-        
-        # Test employee registration
-        employee_data = {
-            "email": f"employee_{timestamp}@test.com",
-            "password": "TestPass123!",
-            "name": f"Test Employee {timestamp}",
-            "role": "employee"
-        }
-        
-        success, status, response = self.make_request('POST', 'auth/register', employee_data, expected_status=200)
-        
-        if success and 'token' in response and 'user' in response:
-            self.employee_token = response['token']
-            self.employee_user = response['user']
-            self.log_test("Employee Registration", True)
-        else:
-            self.log_test("Employee Registration", False, f"Status: {status}, Response: {response}")
-            return False
-
-        # Test employer registration
-        employer_data = {
-            "email": f"employer_{timestamp}@test.com",
-            "password": "TestPass123!",
-            "name": f"Test Employer {timestamp}",
-            "role": "employer"
-        }
-        
-        success, status, response = self.make_request('POST', 'auth/register', employer_data, expected_status=200)
-        
-        if success and 'token' in response and 'user' in response:
-            self.employer_token = response['token']
-            self.employer_user = response['user']
-            self.log_test("Employer Registration", True)
-            return True
-        else:
-            self.log_test("Employer Registration", False, f"Status: {status}, Response: {response}")
-            return False
-
-    def test_user_login(self):
-        """Test user login functionality"""
-        if not self.employee_user:
-            self.log_test("Employee Login", False, "No employee user to test login")
-            return False
-
-        login_data = {
-            "email": self.employee_user['email'],
-            "password": "TestPass123!"
-        }
-        
-        success, status, response = self.make_request('POST', 'auth/login', login_data, expected_status=200)
-        
-        if success and 'token' in response:
-            self.log_test("Employee Login", True)
-            return True
-        else:
-            self.log_test("Employee Login", False, f"Status: {status}, Response: {response}")
-            return False
-
-    def test_punch_in(self):
-        """Test employee punch in functionality"""
-        if not self.employee_token:
-            self.log_test("Punch In", False, "No employee token available")
-            return False
-
-        success, status, response = self.make_request('POST', 'attendance/punch-in', {}, self.employee_token, expected_status=200)
-        
-        if success and 'message' in response and 'punch_in_time' in response:
-            self.log_test("Punch In", True)
-            return True
-        else:
-            self.log_test("Punch In", False, f"Status: {status}, Response: {response}")
-            return False
-
-    def test_today_status(self):
-        """Test getting today's attendance status"""
-        if not self.employee_token:
-            self.log_test("Today Status", False, "No employee token available")
-            return False
-
-        success, status, response = self.make_request('GET', 'attendance/today-status', token=self.employee_token, expected_status=200)
-        
-        if success and 'has_attendance' in response:
-            self.log_test("Today Status", True)
-            return True
-        else:
-            self.log_test("Today Status", False, f"Status: {status}, Response: {response}")
-            return False
-
-    def test_start_break(self):
-        """Test starting a break"""
-        if not self.employee_token:
-            self.log_test("Start Break", False, "No employee token available")
-            return False
-
-        success, status, response = self.make_request('POST', 'attendance/start-break', {}, self.employee_token, expected_status=200)
-        
-        if success and 'message' in response and 'break_start_time' in response:
-            self.log_test("Start Break", True)
-            return True
-        else:
-            self.log_test("Start Break", False, f"Status: {status}, Response: {response}")
-            return False
-
-    def test_end_break(self):
-        """Test ending a break"""
-        if not self.employee_token:
-            self.log_test("End Break", False, "No employee token available")
+    def claim_accounts(self):
+        """Lock the saved accounts for this run; False if a concurrent run already holds them"""
+        fd = os.open(self.accounts_path.with_suffix('.lock'), os.O_WRONLY | os.O_CREAT, 0o600)
+        try:
+            # The OS drops the lock when this process exits, even if it crashes
+            fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            os.close(fd)
             return False
-
-        success, status, response = self.make_request('POST', 'attendance/end-break', {}, self.employee_token, expected_status=200)
-        
-        if success and 'message' in response and 'break_end_time' in response:
-            self.log_test("End Break", True)
-            return True
+        self._accounts_lock = fd
+        return True
+
+    def save_accounts(self):
+        """Persist the registered users so the next run can skip registration"""
+        # A run that couldn't claim the saved accounts leaves them to the run that did
+        if self._accounts_lock is None:
+            return
+        accounts = {"employee": self.employee_user, "employer": self.employer_user}
+        write_private(self.accounts_path, json.dumps(accounts))
+
+    def set_account(self, role, user, token):
+        """Make user (authenticated by token) the account the tests use for role"""
+        headers = self.auth_headers(token)
+        if role == 'employee':
+            self.employee_user, self.employee_token, self._employee_headers = user, token, headers
         else:
-            self.log_test("End Break", False, f"Status: {status}, Response: {response}")
+            self.employer_user, self.employer_token, self._employer_headers = user, token, headers
+
+    async def token_accepted(self, token, expected_status):
+        """Probe today-status with token; returns (accepted, response body)"""
+        if not token:
+            return False, {}
+        success, _, response = await self.make_request(
+            'GET', 'attendance/today-status', headers=self.auth_headers(token), expected_status=expected_status
+        )
+        return success, response
+
+    async def reuse_accounts(self):
+        """Pick up the previous run's users whose cached tokens are still accepted; True if both were"""
+        # Two runs punching in with the same employee would fail each other's workflow
+        if not self.claim_accounts():
             return False
-
-    def test_punch_out(self):
-        """Test employee punch out functionality"""
-        if not self.employee_token:
-            self.log_test("Punch Out", False, "No employee token available")
+        try:
+            accounts = json.loads(self.accounts_path.read_text())
+            employee_user, employer_user = accounts['employee'], accounts['employer']
+            employee_token = self.cached_token(employee_user['email'])
+            employer_token = self.cached_token(employer_user['email'])
+        except (OSError, ValueError, KeyError, TypeError):
             return False
 
-        success, status, response = self.make_request('POST', 'attendance/punch-out', {}, self.employee_token, expected_status=200)
+        # today-status is employee-only, so a live employer token gets 403 rather than 401
+        (employee_ok, employee_status_body), (employer_ok, _) = await asyncio.gather(
+            self.token_accepted(employee_token, 200),
+            self.token_accepted(employer_token, 403)
+        )
+        if employer_ok:
+            self.set_account('employer', employer_user, employer_token)
+        # The workflow punches in, which an employee can only do once per day, so a same-day rerun needs a new one
+        if employee_ok and not employee_status_body.get('has_attendance'):
+            self.set_account('employee', employee_user, employee_token)
+        return self.employee_token is not None and self.employer_token is not None
+
+    async def test_user_registration(self):
+        """Test user registration for each role that has no reusable account"""
+        # Random rather than time-based, so two runs in the same second don't collide
+        suffix = uuid.uuid4().hex[:12]
+        roles = [role for role, token in (('employee', self.employee_token), ('employer', self.employer_token)) if token is None]
         
-        if success and 'message' in response and 'total_hours' in response:
-            self.log_test("Punch Out", True)
-            return True
-        else:
-            self.log_test("Punch Out", False, f"Status: {status}, Response: {response}")
-            return False
-
-    def test_attendance_history(self):
-        """Test getting attendance history"""
-        if not self.employee_token:
-            self.log_test("Attendance History", False, "No employee token available")
-            return False
-
-        success, status, response = self.make_request('GET', 'attendance/my-history', token=self.employee_token, expected_status=200)
+        # The registrations are independent, so send them together
+        results = await asyncio.gather(*(
+            self.make_request('POST', 'auth/register', {
+                "email": f"{role}_{suffix}@test.com",
+                "password": TEST_PASSWORD,
+                "name": f"Test {role.title()} {suffix}",
+                "role": role
+            }, expected_status=200)
+            for role in roles
+        ))
         
-        if success and isinstance(response, list):
-            self.log_test("Attendance History", True)
-            return True
-        else:
-            self.log_test("Attendance History", False, f"Status: {status}, Response: {response}")
-            return False
-
-    def test_monthly_report(self):
-        """Test employer monthly report functionality"""
-        if not self.employer_token:
-            self.log_test("Monthly Report", False, "No employer token available")
-            return False
-
-        current_date = datetime.now()
-        report_data = {
-            "year": current_date.year,
-            "month": current_date.month
-        }
-
-        success, status, response = self.make_request('POST', 'attendance/monthly-report', report_data, self.employer_token, expected_status=200)
+        for role, (success, status, response) in zip(roles, results):
+            name = f"{role.title()} Registration"
+            if not (success and REGISTRATION_KEYS <= response.keys()):
+                self.log_test(name, False, f"Status: {status}, Response: {response}")
+                return False
+            self.set_account(role, response['user'], response['token'])
+            self.cache_token(response['user']['email'], response['token'])
+            self.log_test(name, True)
         
-        if success and isinstance(response, list):
-            self.log_test("Monthly Report", True)
-            return True
-        else:
-            self.log_test("Monthly Report", False, f"Status: {status}, Response: {response}")
-            return False
+        self.save_accounts()
+        return True
 
-    def test_role_permissions(self):
-        """Test that employees can't access employer endpoints"""
-        if not self.employee_token:
-            self.log_test("Role Permissions", False, "No employee token available")
-            return False
-
-        # Employee should not be able to access monthly report
-        report_data = {"year": 2025, "month": 1}
-        success, status, response = self.make_request('POST', 'attendance/monthly-report', report_data, self.employee_token, expected_status=403)
-        
-        if success:
-            self.log_test("Role Permissions (Employee blocked from employer endpoint)", True)
-            return True
-        else:
-            self.log_test("Role Permissions", False, f"Employee was able to access employer endpoint. Status: {status}")
-            return False
-
-    def test_duplicate_registration(self):
-        """Test that duplicate email registration is prevented"""
-        if not self.employee_user:
-            self.log_test("Duplicate Registration Prevention", False, "No employee user to test duplicate")
-            return False
-
-        duplicate_data = {
-            "email": self.employee_user['email'],
-            "password": "AnotherPass123!",
-            "name": "Duplicate User",
-            "role": "employee"
-        }
-        
-        success, status, response = self.make_request('POST', 'auth/register', duplicate_data, expected_status=400)
+    async def test_user_login(self):
+        """Test user login functionality"""
+        # The registration token stays the working one; this only checks that login works
+        passed, _ = await self.run_check(LOGIN_CHECK)
+        return passed
+
+    async def run_check(self, check):
+        """Run one single-request check; returns (passed, response body)"""
+        name, method, endpoint, build_body, role, expected_status, expected = check
+        headers = None
+        if role:
+            headers = self._employee_headers if role == 'employee' else self._employer_headers
+            if headers is None:
+                self.log_test(name, False, f"No {role} token available")
+                return False, None
+
+        data = build_body(self) if build_body else None
+        success, status, response = await self.make_request(
+            method, endpoint, data, headers=headers, expected_status=expected_status, parse_json=expected is not None
+        )
         
-        if success:
-            self.log_test("Duplicate Registration Prevention", True)
-            return True
+        if expected is list:
+            passed = success and isinstance(response, list)
+        elif expected:
+            passed = success and isinstance(response, dict) and expected <= response.keys()
         else:
-            self.log_test("Duplicate Registration Prevention", False, f"Duplicate registration was allowed. Status: {status}")
-            return False
-
-    def run_all_tests(self):
-        """Run all tests in sequence"""
+            passed = success
+
+        self.log_test(name, passed, "" if passed else f"Status: {status}, Response: {response}")
+        return passed, response
+
+    async def test_attendance_workflow(self):
+        """Test punch-in -> status -> break -> punch-out, stopping at the first failed step"""
+        for index, step in enumerate(WORKFLOW_STEPS):
+            passed, _ = await self.run_check(step)
+            if not passed:
+                for name, *_ in WORKFLOW_STEPS[index + 1:]:
+                    self.log_test(name, False, "Not run: an earlier step failed")
+                return False
+        return True
+
+    async def run_all_tests(self):
+        """Run all tests"""
         print("🚀 Starting Attendance API Tests...")
         print(f"Testing against: {self.base_url}")
         print("=" * 60)
 
-        # Test user registration and authentication
-        if not self.test_user_registration():
+        # Register fresh users only when the previous run's can't be reused
+        if await self.reuse_accounts():
+            print(f"♻️  Reusing test accounts from {self.accounts_path}")
+        elif not await self.test_user_registration():
             print("❌ Registration failed - stopping tests")
             return self.get_results()
 
-        self.test_user_login()
-        self.test_duplicate_registration()
-
-        # Test attendance workflow
-        self.test_punch_in()
-        self.test_today_status()
-        self.test_start_break()
-        
-        # Wait a moment for break to register
-        time.sleep(1)
-        
-        self.test_end_break()
-        self.test_punch_out()
-        self.test_attendance_history()
-
-        # Test employer functionality
-        self.test_monthly_report()
-        self.test_role_permissions()
+        # Everything below only needs the registered users, so the attendance
+        # workflow (which must stay in order) runs alongside the independent checks
+        await asyncio.gather(
+            self.test_attendance_workflow(),
+            self.test_user_login(),
+            *(self.run_check(check) for check in API_CHECKS),
+        )
 
         return self.get_results()
 
@@ -315,12 +349,12 @@ class AttendanceAPITester:
             "success_rate": success_rate
         }
 
-def main():
-    tester = AttendanceAPITester()
-    results = tester.run_all_tests()
+async def main():
+    async with AttendanceAPITester() as tester:
+        results = await tester.run_all_tests()
     
     # Return appropriate exit code
     return 0 if results["success_rate"] >= 80 else 1
 
 if __name__ == "__main__":
-    sys.exit(main())
\ No newline at end of file
+    sys.exit(asyncio.run(main()))
\ No newline at end of file